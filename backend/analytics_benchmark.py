@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+SUÉLTALO token-flow analytics benchmark
+Compares per-token window queries over raw transactions with the hourly bucket
+reductions used by /api/analytics/tokens on a synthetic transaction set (10M rows
+by default). Top counterparties are reduced inside Mongo and are not covered here.
+
+Run from backend/ with the same .env as server.py; the benchmark never connects to Mongo.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from server import ANALYTICS_METRICS, summarize_token_buckets
+
+TOKENS = np.array(["SOL", "USDC", "SLT"])
+START = np.datetime64("2026-01-01T00:00:00")
+
+def timed(label, fn, repeat=3):
+    """Run fn a few times and report the best wall-clock time"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"   {label:<48} {best * 1000:>10.1f} ms")
+    return result
+
+def synthetic_transactions(count, days, wallets, seed=42):
+    """Raw transactions shaped like the `transactions` collection"""
+    rng = np.random.default_rng(seed)
+    token_codes = rng.choice(len(TOKENS), size=count, p=[0.2, 0.7, 0.1])
+    amounts = rng.exponential(25.0, size=count)
+    is_airdrop = (token_codes == 2) & (rng.random(count) < 0.3)
+    return pd.DataFrame({
+        "timestamp": START + rng.integers(0, days * 86400, size=count).astype("timedelta64[s]"),
+        "token_type": pd.Categorical.from_codes(token_codes, TOKENS),
+        "from_address": np.where(is_airdrop, -1, rng.integers(0, wallets, size=count)),
+        "to_address": rng.integers(0, wallets, size=count),
+        "amount": amounts,
+        "reward_slt": np.where(token_codes == 1, amounts * 0.1, 0.0),
+        "is_airdrop": is_airdrop
+    })
+
+def token_buckets(transactions):
+    """Same rollup as token_bucket_pipeline, done in pandas"""
+    frame = pd.DataFrame({
+        "hour": transactions["timestamp"].dt.floor("h"),
+        "token_type": transactions["token_type"],
+        "volume": np.where(transactions["is_airdrop"], 0.0, transactions["amount"]),
+        "transfer_count": (~transactions["is_airdrop"]).astype(np.int64),
+        "reward_slt": transactions["reward_slt"],
+        "airdrop_slt": np.where(transactions["is_airdrop"], transactions["amount"], 0.0)
+    })
+    buckets = frame.groupby(["hour", "token_type"], observed=True)[ANALYTICS_METRICS].sum().reset_index()
+    buckets["token_type"] = buckets["token_type"].astype(str)
+    return buckets
+
+def raw_window_summary(transactions, start, end):
+    """Baseline: scan every raw transaction in the window"""
+    window = transactions[(transactions["timestamp"] >= start) & (transactions["timestamp"] < end)]
+    return window.groupby("token_type", observed=True)["amount"].agg(["sum", "size"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--wallets", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"📊 Analytics benchmark: {args.transactions:,} transactions, {args.days} days, {args.wallets:,} wallets")
+    print("=" * 72)
+
+    transactions = timed("generate synthetic transactions", lambda: synthetic_transactions(
+        args.transactions, args.days, args.wallets), repeat=1)
+    tokens = timed("build hourly token buckets", lambda: token_buckets(transactions), repeat=1)
+    print(f"   {len(tokens):,} token buckets")
+    print()
+
+    end = START + np.timedelta64(args.days, "D")
+    for label, hours in [("24h", 24), ("7d", 24 * 7), ("30d", 24 * 30)]:
+        start = end - np.timedelta64(hours, "h")
+        print(f"⏱  Window {label}")
+        timed("raw scan: per-token totals", lambda: raw_window_summary(transactions, start, end))
+        timed("buckets: per-token totals + series", lambda: summarize_token_buckets(
+            tokens[(tokens["hour"] >= start) & (tokens["hour"] < end)], "h"))
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
@@ -12,13 +15,78 @@ from datetime import datetime, timedelta
 import time
 import asyncio
 import json
+import cProfile
+import pstats
+import io
+import random
+import math
+import hashlib
+import hmac
+from collections import deque, OrderedDict
+from contextvars import ContextVar
+import pandas as pd
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Profiling configuration
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', '50'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Analytics configuration
+ANALYTICS_REFRESH_SECONDS = int(os.environ.get('ANALYTICS_REFRESH_SECONDS', '300'))
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '256'))
+ANALYTICS_LEASE_SECONDS = int(os.environ.get('ANALYTICS_LEASE_SECONDS', str(2 * ANALYTICS_REFRESH_SECONDS)))
+
+# Idempotency configuration
+IDEMPOTENCY_BLOOM_CAPACITY = int(os.environ.get('IDEMPOTENCY_BLOOM_CAPACITY', '1000000'))
+IDEMPOTENCY_LRU_SIZE = int(os.environ.get('IDEMPOTENCY_LRU_SIZE', '10000'))
+REWARD_LEDGER_SIZE = int(os.environ.get('REWARD_LEDGER_SIZE', '1000'))
+
+# Leaderboard configuration
+LEADERBOARD_RECONCILE_SECONDS = int(os.environ.get('LEADERBOARD_RECONCILE_SECONDS', '600'))
+LEADERBOARD_YIELD_EVERY = int(os.environ.get('LEADERBOARD_YIELD_EVERY', '5000'))
+LEADERBOARD_SEED_RETRY_SECONDS = int(os.environ.get('LEADERBOARD_SEED_RETRY_SECONDS', '5'))
+
+# Mongo commands issued by the current request; motor copies the context into its executor threads
+current_mongo_commands: ContextVar[Optional[list]] = ContextVar("current_mongo_commands", default=None)
+
+class MongoCommandRecorder(monitoring.CommandListener):
+    """Attach each Mongo command and its timing to the request that issued it"""
+
+    def __init__(self):
+        self._started: Dict[int, Dict[str, Any]] = {}
+
+    def started(self, event):
+        commands = current_mongo_commands.get()
+        if commands is None:
+            return
+        entry = {
+            "command": event.command_name,
+            "collection": event.command.get(event.command_name),
+            "duration_ms": None,
+            "success": None
+        }
+        commands.append(entry)
+        self._started[event.request_id] = entry
+
+    def _finish(self, event, success: bool):
+        entry = self._started.pop(event.request_id, None)
+        if entry is not None:
+            entry["duration_ms"] = event.duration_micros / 1000
+            entry["success"] = success
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandRecorder()])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -27,6 +95,14 @@ app = FastAPI(title="SUÉLTALO Crypto Wallet API", version="1.0.0")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Admin-only endpoints check X-Admin-Token against ADMIN_TOKEN; unset disables them
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
 # Models
 class WalletCreate(BaseModel):
     public_key: str
@@ -70,13 +146,53 @@ class KYCStatus(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+# Request coalescing
+class SingleFlight:
+    """Share one in-flight coroutine between identical concurrent reads"""
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.stats = {"executed": 0, "coalesced": 0, "invalidated": 0}
+
+    async def do(self, key: tuple, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._release(k, t))
+        # Shield so one cancelled caller does not cancel the query for the others
+        return await asyncio.shield(task)
+
+    def _release(self, key: tuple, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller went away
+
+    def invalidate(self, *public_keys: str):
+        """Detach in-flight reads for these wallets so later callers re-query after a write"""
+        for key in [k for k in self._inflight if k[1] in public_keys]:
+            del self._inflight[key]
+            self.stats["invalidated"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "inflight": len(self._inflight)}
+
+single_flight = SingleFlight()
+
+# Wallet reads skip the reward ledger kept for idempotent reward grants
+_WALLET_PROJECTION = {"rewarded_transactions": 0}
+
 # Wallet endpoints
 @api_router.post("/wallet", response_model=WalletResponse)
 async def create_wallet(wallet: WalletCreate):
     """Create or register a new wallet"""
     try:
         # Check if wallet already exists
-        existing_wallet = await db.wallets.find_one({"public_key": wallet.public_key})
+        existing_wallet = await db.wallets.find_one({"public_key": wallet.public_key}, _WALLET_PROJECTION)
         if existing_wallet:
             return WalletResponse(**existing_wallet)
         
@@ -86,6 +202,7 @@ async def create_wallet(wallet: WalletCreate):
         )
         
         await db.wallets.insert_one(wallet_data.dict())
+        single_flight.invalidate(wallet.public_key)
         return wallet_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create wallet: {str(e)}")
@@ -94,7 +211,7 @@ async def create_wallet(wallet: WalletCreate):
 async def get_wallet(public_key: str):
     """Get wallet information"""
     try:
-        wallet = await db.wallets.find_one({"public_key": public_key})
+        wallet = await db.wallets.find_one({"public_key": public_key}, _WALLET_PROJECTION)
         if not wallet:
             raise HTTPException(status_code=404, detail="Wallet not found")
         
@@ -104,79 +221,269 @@ async def get_wallet(public_key: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get wallet: {str(e)}")
 
+async def _load_wallet_balance(public_key: str):
+    wallet = await db.wallets.find_one({"public_key": public_key}, _WALLET_PROJECTION)
+    if not wallet:
+        # Create wallet if it doesn't exist
+        wallet_data = WalletResponse(
+            public_key=public_key,
+            address=public_key
+        )
+        await db.wallets.insert_one(wallet_data.dict())
+        wallet = wallet_data.dict()
+
+    # In a real implementation, you would query Solana RPC for actual balances
+    # For now, return stored balances with some mock updates
+    return {
+        "public_key": public_key,
+        "balances": {
+            "SOL": wallet.get("balance_sol", 0.0),
+            "USDC": wallet.get("balance_usdc", 0.0),
+            "SLT": wallet.get("balance_slt", 0.0)
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @api_router.get("/wallet/{public_key}/balance")
 async def get_wallet_balance(public_key: str):
     """Get wallet balances for all tokens"""
     try:
-        wallet = await db.wallets.find_one({"public_key": public_key})
-        if not wallet:
-            # Create wallet if it doesn't exist
-            wallet_data = WalletResponse(
-                public_key=public_key,
-                address=public_key
-            )
-            await db.wallets.insert_one(wallet_data.dict())
-            wallet = wallet_data.dict()
-        
-        # In a real implementation, you would query Solana RPC for actual balances
-        # For now, return stored balances with some mock updates
-        return {
-            "public_key": public_key,
-            "balances": {
-                "SOL": wallet.get("balance_sol", 0.0),
-                "USDC": wallet.get("balance_usdc", 0.0),
-                "SLT": wallet.get("balance_slt", 0.0)
-            },
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        return await single_flight.do(
+            ("balance", public_key, ()),
+            lambda: _load_wallet_balance(public_key)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get balance: {str(e)}")
 
+# Idempotent transaction ingest
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys; false positives only, never false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class IdempotencyGuard:
+    """Recent-key LRU plus a Bloom filter in front of the unique idempotency_key index"""
+
+    def __init__(self, capacity: int, lru_size: int):
+        self.bloom = BloomFilter(capacity)
+        self._recent: OrderedDict = OrderedDict()
+        self._lru_size = lru_size
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.stats = {"lru_hits": 0, "bloom_negatives": 0, "mongo_lookups": 0, "duplicates_rejected": 0}
+
+    def recent(self, key: str) -> Optional[TransactionResponse]:
+        transaction = self._recent.get(key)
+        if transaction is not None:
+            self._recent.move_to_end(key)
+            self.stats["lru_hits"] += 1
+        return transaction
+
+    def remember(self, key: str, transaction: TransactionResponse):
+        """Only for transactions whose reward is committed; LRU hits skip finishing it"""
+        self.bloom.add(key)
+        self._recent[key] = transaction
+        self._recent.move_to_end(key)
+        if len(self._recent) > self._lru_size:
+            self._recent.popitem(last=False)
+
+    async def lookup(self, key: str) -> Optional[TransactionResponse]:
+        """Find an earlier transaction for this key, touching Mongo only on a Bloom hit"""
+        transaction = self.recent(key)
+        if transaction is not None:
+            return transaction
+        if key not in self.bloom:
+            self.stats["bloom_negatives"] += 1
+            return None
+        self.stats["mongo_lookups"] += 1
+        existing = await db.transactions.find_one({"idempotency_key": key})
+        if not existing:
+            return None
+        transaction = await finish_stored_transaction(existing)
+        self.remember(key, transaction)
+        return transaction
+
+    async def ingest_once(self, key: str, ingest) -> tuple:
+        """Run ingest at most once per key in this process; concurrent retries wait for the first"""
+        transaction = await self.lookup(key)
+        if transaction is None and key in self._pending:
+            # Shield so a retry whose client went away does not cancel the original
+            transaction = await asyncio.shield(self._pending[key])
+        if transaction is not None:
+            return transaction, True
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        result = (None, False)
+        try:
+            result = await ingest()
+            return result
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            # Waiters on a failed ingest get None and try the insert themselves
+            future.set_result(result[0])
+
+    def replay(self, existing: TransactionResponse, transaction: TransactionCreate) -> TransactionResponse:
+        """Return the original transaction for a retry, rejecting a key reused for a different transfer"""
+        if (existing.from_address, existing.to_address, existing.amount, existing.token_type) != (
+            transaction.from_address, transaction.to_address, transaction.amount, transaction.token_type
+        ):
+            raise HTTPException(status_code=409, detail="Idempotency key already used for a different transaction")
+        self.stats["duplicates_rejected"] += 1
+        return existing
+
+idempotency_guard = IdempotencyGuard(IDEMPOTENCY_BLOOM_CAPACITY, IDEMPOTENCY_LRU_SIZE)
+
+async def ensure_idempotency_index():
+    """Create the unique key index that guarantees one transaction (and reward) per key.
+
+    Awaited in the startup hook: serving traffic without it would let retries insert
+    duplicates, after which the index could never be built.
+    """
+    await db.transactions.create_index(
+        "idempotency_key",
+        unique=True,
+        partialFilterExpression={"idempotency_key": {"$type": "string"}}
+    )
+
+async def seed_idempotency_bloom():
+    """Add keys already stored to the Bloom filter; until then those keys just cost a Mongo insert attempt"""
+    try:
+        cursor = db.transactions.find(
+            {"idempotency_key": {"$type": "string"}},
+            {"_id": 0, "idempotency_key": 1}
+        )
+        count = 0
+        async for transaction in cursor:
+            idempotency_guard.bloom.add(transaction["idempotency_key"])
+            count += 1
+            if count % 5000 == 0:
+                await asyncio.sleep(0)
+    except Exception as e:
+        logger.error(f"Failed to seed idempotency Bloom filter: {str(e)}")
+
 # Transaction endpoints
+async def _grant_transaction_reward(document_id: Any, transaction: TransactionResponse):
+    """Credit a stored transaction's SLT reward to the sender once, then mark it granted.
+
+    The $inc only matches while the transaction id is missing from the wallet's recent
+    reward ledger and pushes it in the same update, so a retry after a failure or
+    cancellation anywhere in here finishes the reward without paying it twice.
+    """
+    wallet = await db.wallets.find_one_and_update(
+        {"public_key": transaction.from_address, "rewarded_transactions": {"$ne": transaction.id}},
+        {
+            "$inc": {"balance_slt": transaction.reward_slt, "slt_version": 1},
+            "$push": {"rewarded_transactions": {"$each": [transaction.id], "$slice": -REWARD_LEDGER_SIZE}}
+        },
+        projection={"balance_slt": 1, "slt_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if wallet:
+        record_slt_balance(transaction.from_address, wallet["balance_slt"], wallet["slt_version"])
+        single_flight.invalidate(transaction.from_address)
+    await db.transactions.update_one({"_id": document_id}, {"$set": {"reward_granted": True}})
+
+async def finish_stored_transaction(document: Dict[str, Any]) -> TransactionResponse:
+    """Transaction for a stored document, granting its reward if an earlier attempt stopped short"""
+    transaction = TransactionResponse(**document)
+    # Documents from before reward_granted existed were rewarded inline
+    if not document.get("reward_granted", True):
+        await _grant_transaction_reward(document["_id"], transaction)
+    return transaction
+
+async def _ingest_transaction(transaction: TransactionCreate, key: Optional[str]) -> tuple:
+    """Insert a transaction and grant its reward; returns (transaction, replayed)"""
+    # Calculate SLT reward for USDC transactions
+    reward_slt = 0.0
+    if transaction.token_type == "USDC" and transaction.amount > 0:
+        # Give 0.1 SLT per USDC transferred
+        reward_slt = transaction.amount * 0.1
+    
+    transaction_data = TransactionResponse(
+        from_address=transaction.from_address,
+        to_address=transaction.to_address,
+        amount=transaction.amount,
+        token_type=transaction.token_type,
+        signature=transaction.signature,
+        reward_slt=reward_slt
+    )
+    
+    document = transaction_data.dict()
+    # Stays False until the sender is credited, so a replay can finish an interrupted reward
+    document["reward_granted"] = reward_slt <= 0
+    if key:
+        document["idempotency_key"] = key
+    try:
+        result = await db.transactions.insert_one(document)
+    except DuplicateKeyError:
+        # Another request or process won the insert; finish its reward if it never got that far
+        existing = await finish_stored_transaction(await db.transactions.find_one({"idempotency_key": key}))
+        idempotency_guard.remember(key, existing)
+        return existing, True
+    
+    # Update sender's SLT balance with reward
+    if reward_slt > 0:
+        await _grant_transaction_reward(result.inserted_id, transaction_data)
+    if key:
+        idempotency_guard.remember(key, transaction_data)
+    
+    single_flight.invalidate(transaction.from_address, transaction.to_address)
+    return transaction_data, False
+
 @api_router.post("/transaction", response_model=TransactionResponse)
-async def create_transaction(transaction: TransactionCreate):
-    """Create a new transaction record"""
+async def create_transaction(transaction: TransactionCreate, idempotency_key: Optional[str] = Header(None)):
+    """Create a new transaction record (idempotent on Idempotency-Key or signature)"""
     try:
-        # Calculate SLT reward for USDC transactions
-        reward_slt = 0.0
-        if transaction.token_type == "USDC" and transaction.amount > 0:
-            # Give 0.1 SLT per USDC transferred
-            reward_slt = transaction.amount * 0.1
+        key = idempotency_key or transaction.signature
+        if not key:
+            transaction_data, _ = await _ingest_transaction(transaction, None)
+            return transaction_data
         
-        transaction_data = TransactionResponse(
-            from_address=transaction.from_address,
-            to_address=transaction.to_address,
-            amount=transaction.amount,
-            token_type=transaction.token_type,
-            signature=transaction.signature,
-            reward_slt=reward_slt
+        transaction_data, replayed = await idempotency_guard.ingest_once(
+            key,
+            lambda: _ingest_transaction(transaction, key)
         )
-        
-        await db.transactions.insert_one(transaction_data.dict())
-        
-        # Update sender's SLT balance with reward
-        if reward_slt > 0:
-            await db.wallets.update_one(
-                {"public_key": transaction.from_address},
-                {"$inc": {"balance_slt": reward_slt}}
-            )
-        
-        return transaction_data
+        return idempotency_guard.replay(transaction_data, transaction) if replayed else transaction_data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create transaction: {str(e)}")
 
+async def _load_wallet_transactions(public_key: str, limit: int):
+    transactions = await db.transactions.find({
+        "$or": [
+            {"from_address": public_key},
+            {"to_address": public_key}
+        ]
+    }).sort("timestamp", -1).limit(limit).to_list(limit)
+
+    return [TransactionResponse(**tx) for tx in transactions]
+
 @api_router.get("/wallet/{public_key}/transactions", response_model=List[TransactionResponse])
 async def get_wallet_transactions(public_key: str, limit: int = 50):
     """Get transaction history for a wallet"""
     try:
-        transactions = await db.transactions.find({
-            "$or": [
-                {"from_address": public_key},
-                {"to_address": public_key}
-            ]
-        }).sort("timestamp", -1).limit(limit).to_list(limit)
-        
-        return [TransactionResponse(**tx) for tx in transactions]
+        return await single_flight.do(
+            ("transactions", public_key, (("limit", limit),)),
+            lambda: _load_wallet_transactions(public_key, limit)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get transactions: {str(e)}")
 
@@ -188,14 +495,16 @@ async def update_transaction_status(transaction_id: str, status: str, signature:
         if signature:
             update_data["signature"] = signature
         
-        result = await db.transactions.update_one(
+        transaction = await db.transactions.find_one_and_update(
             {"id": transaction_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"from_address": 1, "to_address": 1}
         )
         
-        if result.matched_count == 0:
+        if transaction is None:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
+        single_flight.invalidate(transaction["from_address"], transaction["to_address"])
         return {"success": True, "message": "Transaction status updated"}
     except HTTPException:
         raise
@@ -273,11 +582,14 @@ async def airdrop_slt(wallet_address: str, amount: float):
     """Airdrop SLT tokens to a wallet"""
     try:
         # Update wallet SLT balance
-        result = await db.wallets.update_one(
+        wallet = await db.wallets.find_one_and_update(
             {"public_key": wallet_address},
-            {"$inc": {"balance_slt": amount}},
-            upsert=True
+            {"$inc": {"balance_slt": amount, "slt_version": 1}},
+            projection={"balance_slt": 1, "slt_version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        record_slt_balance(wallet_address, wallet["balance_slt"], wallet["slt_version"])
         
         # Record the airdrop as a transaction
         airdrop_tx = TransactionResponse(
@@ -289,6 +601,7 @@ async def airdrop_slt(wallet_address: str, amount: float):
         )
         
         await db.transactions.insert_one(airdrop_tx.dict())
+        single_flight.invalidate(wallet_address)
         
         return {
             "success": True,
@@ -298,6 +611,709 @@ async def airdrop_slt(wallet_address: str, amount: float):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to airdrop SLT: {str(e)}")
 
+# SLT leaderboard
+class _SkipNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+class SLTLeaderboard:
+    """Indexable skip list of wallets ordered by (-balance_slt, public_key); rank lookups are O(log n)"""
+
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self._nil = _SkipNode(None, 0)
+        self._head = _SkipNode(None, self.MAX_LEVEL)
+        self._head.next = [self._nil] * self.MAX_LEVEL
+        self._level = 1  # levels above this only link head to nil
+        self._keys: Dict[str, tuple] = {}
+        # Highest slt_version applied per wallet, so late writebacks of older $incs are ignored.
+        # Holds wallets on the board plus ones emptied by a versioned write; see update()
+        self._versions: Dict[str, int] = {}
+        # Bulk-load state: last node and its position on each level
+        self._tails: Optional[List[tuple]] = None
+        self._last_key: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _insert(self, key: tuple):
+        new_level = self._random_level()
+        if new_level > self._level:
+            for level in range(self._level, new_level):
+                self._head.width[level] = len(self._keys) + 1
+            self._level = new_level
+
+        chain = [self._head] * self._level
+        steps_at_level = [0] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level] is not self._nil and node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new_node = _SkipNode(key, new_level)
+        steps = 0
+        for level in range(new_level):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(new_level, self._level):
+            chain[level].width[level] += 1
+
+    def _remove(self, key: tuple):
+        chain = [self._head] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level] is not self._nil and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self._level):
+            chain[level].width[level] -= 1
+
+    def update(self, public_key: str, balance_slt: float, version: Optional[int] = None):
+        """Set a wallet's balance; wallets without SLT are left off the board.
+
+        With a version (the wallet's slt_version after the write), balances older than
+        one already applied are ignored, so concurrent $incs land in Mongo order. An
+        unversioned write of 0 (reconciliation found no SLT in Mongo) also forgets the
+        version; a stale writeback arriving after that is corrected by the next reconcile.
+        """
+        if version is not None:
+            if version < self._versions.get(public_key, -1):
+                return
+            self._versions[public_key] = version
+        elif balance_slt <= 0:
+            self._versions.pop(public_key, None)
+        old_key = self._keys.pop(public_key, None)
+        if old_key is not None:
+            self._remove(old_key)
+        if balance_slt > 0:
+            key = (-balance_slt, public_key)
+            self._insert(key)
+            self._keys[public_key] = key
+
+    def append_sorted(self, public_key: str, balance_slt: float, version: int = 0) -> bool:
+        """Bulk-load a wallet ranked below every wallet already on the board in O(1) expected.
+
+        Only valid on a board nothing else reads or updates until finish_bulk(). Returns
+        False for wallets that are out of order, duplicated or without SLT; callers apply
+        those with update() after finish_bulk().
+        """
+        key = (-balance_slt, public_key)
+        if balance_slt <= 0 or public_key in self._keys or (self._last_key is not None and key <= self._last_key):
+            return False
+        if self._tails is None:
+            self._tails = [(self._head, 0)] * self.MAX_LEVEL
+
+        position = len(self._keys) + 1
+        new_level = self._random_level()
+        self._level = max(self._level, new_level)
+        new_node = _SkipNode(key, new_level)
+        new_node.next = [self._nil] * new_level
+        for level in range(new_level):
+            prev, prev_position = self._tails[level]
+            prev.next[level] = new_node
+            prev.width[level] = position - prev_position
+            self._tails[level] = (new_node, position)
+        self._keys[public_key] = key
+        self._versions[public_key] = version
+        self._last_key = key
+        return True
+
+    def finish_bulk(self):
+        """Set the widths from each level's last node to nil once bulk loading is done"""
+        size = len(self._keys)
+        for level, (node, position) in enumerate(self._tails or []):
+            node.width[level] = size - position + 1
+        self._tails = None
+        self._last_key = None
+
+    def public_keys(self) -> List[str]:
+        return list(self._keys)
+
+    def rank(self, public_key: str) -> Optional[int]:
+        key = self._keys.get(public_key)
+        if key is None:
+            return None
+        position = 0
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level] is not self._nil and node.next[level].key <= key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def balance(self, public_key: str) -> float:
+        key = self._keys.get(public_key)
+        return -key[0] if key else 0.0
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        entries = []
+        node = self._head.next[0]
+        while node is not self._nil and len(entries) < limit:
+            entries.append({"rank": len(entries) + 1, "public_key": node.key[1], "balance_slt": -node.key[0]})
+            node = node.next[0]
+        return entries
+
+slt_leaderboard = SLTLeaderboard()
+leaderboard_state: Dict[str, Any] = {"rebuilding": False, "dirty": set(), "reconciled_at": None}
+
+def record_slt_balance(public_key: str, balance_slt: float, version: int):
+    """Apply a balance written by a reward or airdrop $inc to the in-memory leaderboard.
+
+    Writebacks of concurrent $incs can finish out of order; the slt_version bumped by
+    the same $inc lets the board drop the older one instead of keeping a stale balance.
+    """
+    slt_leaderboard.update(public_key, balance_slt, version)
+    if leaderboard_state["rebuilding"]:
+        leaderboard_state["dirty"].add(public_key)
+
+_LEADERBOARD_PROJECTION = {"_id": 0, "public_key": 1, "balance_slt": 1, "slt_version": 1}
+
+async def _seed_slt_leaderboard() -> SLTLeaderboard:
+    """Bulk-load a board in O(n) from the (balance_slt desc, public_key asc) index"""
+    board = SLTLeaderboard()
+    out_of_order = []
+    cursor = db.wallets.find({"balance_slt": {"$gt": 0}}, _LEADERBOARD_PROJECTION).sort(
+        [("balance_slt", -1), ("public_key", 1)]
+    )
+    count = 0
+    async for wallet in cursor:
+        if not board.append_sorted(wallet["public_key"], wallet["balance_slt"], wallet.get("slt_version", 0)):
+            out_of_order.append(wallet)
+        count += 1
+        # Motor hands over whole batches without awaiting; give requests a turn
+        if count % LEADERBOARD_YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+    board.finish_bulk()
+    for wallet in out_of_order:
+        board.update(wallet["public_key"], wallet["balance_slt"], wallet.get("slt_version", 0))
+    return board
+
+async def _patch_slt_leaderboard(board: SLTLeaderboard, dirty: set):
+    """Diff Mongo against the live board and update only wallets whose balance changed"""
+    seen = set()
+    count = 0
+    async for wallet in db.wallets.find({"balance_slt": {"$gt": 0}}, _LEADERBOARD_PROJECTION):
+        public_key = wallet["public_key"]
+        seen.add(public_key)
+        if public_key not in dirty and board.balance(public_key) != wallet["balance_slt"]:
+            board.update(public_key, wallet["balance_slt"], wallet.get("slt_version", 0))
+        count += 1
+        if count % LEADERBOARD_YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+    
+    # Wallets on the board that no longer hold SLT in Mongo
+    for count, public_key in enumerate(board.public_keys(), 1):
+        if public_key not in seen and public_key not in dirty:
+            board.update(public_key, 0.0)
+        if count % LEADERBOARD_YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+
+async def reconcile_slt_leaderboard():
+    """Bring the board in line with Mongo without blocking the event loop.
+
+    The first run bulk-loads a private board (the live one is still empty) and swaps it
+    in; later runs patch the live board in place so only one full board is ever held.
+    """
+    global slt_leaderboard
+    dirty = set()
+    leaderboard_state.update(rebuilding=True, dirty=dirty)
+    try:
+        if leaderboard_state["reconciled_at"] is None:
+            slt_leaderboard = await _seed_slt_leaderboard()
+        else:
+            await _patch_slt_leaderboard(slt_leaderboard, dirty)
+        
+        # Balances written during the scan may predate it; re-read them until none are outstanding
+        while dirty:
+            public_keys = list(dirty)
+            dirty.clear()
+            found = set()
+            async for wallet in db.wallets.find({"public_key": {"$in": public_keys}}, _LEADERBOARD_PROJECTION):
+                slt_leaderboard.update(
+                    wallet["public_key"], wallet.get("balance_slt", 0.0), wallet.get("slt_version", 0)
+                )
+                found.add(wallet["public_key"])
+            for public_key in set(public_keys) - found:
+                slt_leaderboard.update(public_key, 0.0)
+        
+        leaderboard_state["reconciled_at"] = datetime.utcnow()
+    finally:
+        leaderboard_state["rebuilding"] = False
+
+async def leaderboard_reconcile_loop():
+    seed_retry = LEADERBOARD_SEED_RETRY_SECONDS
+    while True:
+        try:
+            if leaderboard_state["reconciled_at"] is None:
+                await db.wallets.create_index([("balance_slt", -1), ("public_key", 1)])
+            await reconcile_slt_leaderboard()
+        except Exception as e:
+            logger.error(f"Failed to reconcile SLT leaderboard: {str(e)}")
+        if leaderboard_state["reconciled_at"] is None:
+            # The board is not served until seeded, so retry a failed seed with backoff
+            await asyncio.sleep(seed_retry)
+            seed_retry = min(seed_retry * 2, LEADERBOARD_RECONCILE_SECONDS)
+        else:
+            await asyncio.sleep(LEADERBOARD_RECONCILE_SECONDS)
+
+def _seeded_leaderboard_time() -> str:
+    """reconciled_at of the board, or 503 while it only holds wallets written since startup"""
+    if leaderboard_state["reconciled_at"] is None:
+        raise HTTPException(status_code=503, detail="SLT leaderboard is still being seeded")
+    return leaderboard_state["reconciled_at"].isoformat()
+
+@api_router.get("/leaderboard/slt")
+async def get_slt_leaderboard(limit: int = 10):
+    """Top SLT holders"""
+    reconciled_at = _seeded_leaderboard_time()
+    return {
+        "entries": slt_leaderboard.top(max(0, min(limit, 100))),
+        "total_holders": len(slt_leaderboard),
+        "reconciled_at": reconciled_at
+    }
+
+@api_router.get("/leaderboard/slt/{public_key}")
+async def get_slt_rank(public_key: str):
+    """Leaderboard rank of a wallet (null when it holds no SLT)"""
+    reconciled_at = _seeded_leaderboard_time()
+    return {
+        "public_key": public_key,
+        "rank": slt_leaderboard.rank(public_key),
+        "balance_slt": slt_leaderboard.balance(public_key),
+        "total_holders": len(slt_leaderboard),
+        "reconciled_at": reconciled_at
+    }
+
+# Token-flow analytics
+ANALYTICS_METRICS = ["volume", "transfer_count", "reward_slt", "airdrop_slt"]
+ANALYTICS_INTERVALS = {"hour": "h", "day": "D"}
+ANALYTICS_REFRESH_OVERLAP = timedelta(hours=1)
+# Bump when a bucket pipeline changes what a metric means; the next refresh rebuilds every bucket
+ANALYTICS_BUCKET_VERSION = 2
+ANALYTICS_WORKER_ID = str(uuid.uuid4())
+
+analytics_cache: Dict[tuple, Any] = {}
+# generation counts refreshes seen by this worker; cached results are tagged with it
+analytics_state: Dict[str, Any] = {"refreshed_at": None, "generation": 0}
+
+def _hour_of(field: str) -> Dict[str, Any]:
+    return {"$dateTrunc": {"date": field, "unit": "hour"}}
+
+def token_bucket_pipeline(since: datetime) -> List[Dict[str, Any]]:
+    """Roll transactions up into (hour, token_type) buckets.
+
+    volume and transfer_count cover transfers only, with the same meaning as in the
+    counterparty buckets; airdrops are reported separately as airdrop_slt.
+    """
+    is_airdrop = {"$eq": ["$from_address", "SYSTEM_AIRDROP"]}
+    return [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {"hour": _hour_of("$timestamp"), "token_type": "$token_type"},
+            "volume": {"$sum": {"$cond": [is_airdrop, 0, "$amount"]}},
+            "transfer_count": {"$sum": {"$cond": [is_airdrop, 0, 1]}},
+            "reward_slt": {"$sum": "$reward_slt"},
+            "airdrop_slt": {"$sum": {"$cond": [is_airdrop, "$amount", 0]}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "hour": "$_id.hour",
+            "token_type": "$_id.token_type",
+            **{metric: 1 for metric in ANALYTICS_METRICS}
+        }},
+        {"$merge": {
+            "into": "analytics_token_buckets",
+            "on": ["hour", "token_type"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+def counterparty_bucket_pipeline(since: datetime) -> List[Dict[str, Any]]:
+    """Roll transfers up into (hour, token_type, address) buckets for both sides of a transfer"""
+    # Airdrops are not transfers and are left out, as in the token buckets' volume and transfer_count
+    return [
+        {"$match": {"timestamp": {"$gte": since}, "from_address": {"$ne": "SYSTEM_AIRDROP"}}},
+        {"$project": {
+            "hour": _hour_of("$timestamp"),
+            "token_type": 1,
+            "amount": 1,
+            "address": ["$from_address", "$to_address"]
+        }},
+        {"$unwind": "$address"},
+        {"$group": {
+            "_id": {"hour": "$hour", "token_type": "$token_type", "address": "$address"},
+            "volume": {"$sum": "$amount"},
+            "transfer_count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "hour": "$_id.hour",
+            "token_type": "$_id.token_type",
+            "address": "$_id.address",
+            "volume": 1,
+            "transfer_count": 1
+        }},
+        {"$merge": {
+            "into": "analytics_counterparty_buckets",
+            "on": ["hour", "token_type", "address"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+async def ensure_analytics_indexes():
+    await db.transactions.create_index("timestamp")
+    await db.analytics_token_buckets.create_index([("hour", 1), ("token_type", 1)], unique=True)
+    await db.analytics_counterparty_buckets.create_index(
+        [("token_type", 1), ("hour", 1), ("address", 1)], unique=True
+    )
+    # Only the refresh lease carries expires_at; the TTL monitor clears it if its holder dies
+    await db.analytics_meta.create_index("expires_at", expireAfterSeconds=0)
+
+async def acquire_analytics_lease() -> bool:
+    """Take or renew the bucket refresh lease; only its holder runs the pipelines.
+
+    The filter matches only a lease we already own or one that has expired, so while
+    another worker holds it the upsert collides on _id and we back off.
+    """
+    now = datetime.utcnow()
+    try:
+        await db.analytics_meta.find_one_and_update(
+            {"_id": "refresh_lease", "$or": [{"owner": ANALYTICS_WORKER_ID}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": ANALYTICS_WORKER_ID, "expires_at": now + timedelta(seconds=ANALYTICS_LEASE_SECONDS)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def refresh_analytics_buckets():
+    """Recompute buckets from one hour before the last refresh onwards.
+
+    The extra hour catches transactions stamped just before an hour boundary but
+    inserted after the previous pipeline read the collection. The watermark is stored
+    in Mongo so a new lease holder carries on where the last one stopped; without it,
+    or after ANALYTICS_BUCKET_VERSION changes, every bucket is rebuilt.
+    """
+    started = datetime.utcnow()
+    state = await db.analytics_meta.find_one({"_id": "refresh_state"})
+    if state and state.get("bucket_version") == ANALYTICS_BUCKET_VERSION:
+        since = state["refreshed_through"].replace(minute=0, second=0, microsecond=0) - ANALYTICS_REFRESH_OVERLAP
+    else:
+        since = datetime(1970, 1, 1)
+    
+    await db.transactions.aggregate(token_bucket_pipeline(since), allowDiskUse=True).to_list(None)
+    await db.transactions.aggregate(counterparty_bucket_pipeline(since), allowDiskUse=True).to_list(None)
+    
+    await db.analytics_meta.update_one(
+        {"_id": "refresh_state"},
+        {"$set": {
+            "refreshed_through": started,
+            "refreshed_at": datetime.utcnow(),
+            "bucket_version": ANALYTICS_BUCKET_VERSION
+        }},
+        upsert=True
+    )
+
+async def sync_analytics_state():
+    """Notice a refresh by any worker and drop cached results computed before it"""
+    state = await db.analytics_meta.find_one({"_id": "refresh_state"}, {"_id": 0, "refreshed_at": 1})
+    refreshed_at = state["refreshed_at"] if state else None
+    if refreshed_at != analytics_state["refreshed_at"]:
+        analytics_state["refreshed_at"] = refreshed_at
+        analytics_state["generation"] += 1
+        analytics_cache.clear()
+
+async def analytics_refresh_loop():
+    indexes_ready = False
+    while True:
+        try:
+            if not indexes_ready:
+                await ensure_analytics_indexes()
+                indexes_ready = True
+            if await acquire_analytics_lease():
+                await refresh_analytics_buckets()
+            await sync_analytics_state()
+        except Exception as e:
+            logger.error(f"Failed to refresh analytics buckets: {str(e)}")
+        await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+
+def summarize_token_buckets(buckets: pd.DataFrame, interval: str) -> Dict[str, Any]:
+    """Per-token totals and a per-interval series from hourly token buckets"""
+    if buckets.empty:
+        return {"totals": [], "series": []}
+    
+    totals = buckets.groupby("token_type", sort=True)[ANALYTICS_METRICS].sum()
+    period = buckets["hour"].dt.floor(interval).rename("period")
+    series = buckets.groupby([period, buckets["token_type"]], sort=True)[ANALYTICS_METRICS].sum()
+    
+    totals = totals.reset_index()
+    series = series.reset_index()
+    series["period"] = series["period"].dt.strftime("%Y-%m-%dT%H:%M:%S")
+    return {
+        "totals": totals.to_dict(orient="records"),
+        "series": series.to_dict(orient="records")
+    }
+
+def top_counterparty_pipeline(start: datetime, end: datetime, token_type: str, limit: int) -> List[Dict[str, Any]]:
+    """Reduce one token's hourly counterparty buckets to the top addresses by volume inside Mongo"""
+    return [
+        {"$match": {"token_type": token_type, "hour": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": "$address",
+            "volume": {"$sum": "$volume"},
+            "transfer_count": {"$sum": "$transfer_count"}
+        }},
+        {"$sort": {"volume": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "address": "$_id", "volume": 1, "transfer_count": 1}}
+    ]
+
+def _analytics_window(start: Optional[datetime], end: Optional[datetime]) -> tuple:
+    """Normalise a query window to naive UTC hour boundaries (last 24h by default)"""
+    def to_hour(value: datetime) -> datetime:
+        if value.tzinfo is not None:
+            value = (value - value.utcoffset()).replace(tzinfo=None)
+        return value.replace(minute=0, second=0, microsecond=0)
+    
+    end = to_hour(end) if end else to_hour(datetime.utcnow()) + timedelta(hours=1)
+    start = to_hour(start) if start else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+async def _cached_analytics(key: tuple, compute):
+    """Serve key from the cache, or compute and cache it if no refresh landed meanwhile.
+
+    A result computed across a refresh may have read pre-refresh buckets, so it is
+    returned but not stored; entries from an older generation are never served.
+    """
+    generation = analytics_state["generation"]
+    cached = analytics_cache.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    result = await compute()
+    if analytics_state["generation"] == generation:
+        if key not in analytics_cache and len(analytics_cache) >= ANALYTICS_CACHE_SIZE:
+            analytics_cache.pop(next(iter(analytics_cache)))
+        analytics_cache[key] = (generation, result)
+    return result
+
+def _token_buckets_frame(docs: List[Dict[str, Any]]) -> pd.DataFrame:
+    buckets = pd.DataFrame(docs, columns=["hour", "token_type", *ANALYTICS_METRICS])
+    buckets["hour"] = pd.to_datetime(buckets["hour"])
+    return buckets
+
+@api_router.get("/analytics/tokens", dependencies=[Depends(require_admin)])
+async def get_token_analytics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = "hour",
+    token_type: Optional[str] = None
+):
+    """Per-token volume, transfer counts and reward issuance over a time window"""
+    if interval not in ANALYTICS_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {list(ANALYTICS_INTERVALS)}")
+    start, end = _analytics_window(start, end)
+    try:
+        async def compute():
+            query = {"hour": {"$gte": start, "$lt": end}}
+            if token_type:
+                query["token_type"] = token_type
+            # At most one document per hour and token, so the window is bounded
+            docs = await db.analytics_token_buckets.find(query, {"_id": 0}).to_list(None)
+            # Keep the pandas reductions off the event loop
+            return await asyncio.to_thread(
+                lambda: summarize_token_buckets(_token_buckets_frame(docs), ANALYTICS_INTERVALS[interval])
+            )
+        
+        summary = await _cached_analytics(("tokens", start, end, interval, token_type), compute)
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "interval": interval,
+            **summary,
+            "refreshed_at": analytics_state["refreshed_at"].isoformat() if analytics_state["refreshed_at"] else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get token analytics: {str(e)}")
+
+@api_router.get("/analytics/counterparties", dependencies=[Depends(require_admin)])
+async def get_top_counterparties(
+    token_type: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 10
+):
+    """Top counterparties of one token by volume over a time window"""
+    start, end = _analytics_window(start, end)
+    limit = max(1, min(limit, 100))
+    try:
+        async def compute():
+            return await db.analytics_counterparty_buckets.aggregate(
+                top_counterparty_pipeline(start, end, token_type, limit),
+                allowDiskUse=True
+            ).to_list(limit)
+        
+        counterparties = await _cached_analytics(("counterparties", start, end, token_type, limit), compute)
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "token_type": token_type,
+            "counterparties": counterparties,
+            "refreshed_at": analytics_state["refreshed_at"].isoformat() if analytics_state["refreshed_at"] else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get counterparties: {str(e)}")
+
+# Service stats
+@api_router.get("/stats/coalescing")
+async def get_coalescing_stats():
+    """Get request coalescing counters"""
+    return {
+        **single_flight.snapshot(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/stats/idempotency")
+async def get_idempotency_stats():
+    """Get duplicate-filter counters for transaction ingest"""
+    return {
+        **idempotency_guard.stats,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+# Request profiling
+slow_requests: deque = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiler_active = False
+_request_counts = {"started": 0, "inflight": 0}
+PROFILE_EXCLUDED_PREFIX = "/api/admin/slow-requests"
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Record Mongo commands per request and optionally profile the window the request was in flight.
+
+    cProfile hooks the whole event-loop thread, so a profile is a process-wide sample of
+    everything that ran while this request was awaiting, not of this request alone. The
+    record carries profile_scope="process" and the number of overlapping requests so
+    readers can judge how much of it belongs to other requests. A requested profile answers
+    with X-Profile-Captured (and X-Profile-Id when captured), since a profile that is already
+    running makes this one skip. The slow-request admin routes are never recorded, so polling
+    them does not evict the records being inspected.
+    """
+    global _profiler_active
+    if request.url.path.startswith(PROFILE_EXCLUDED_PREFIX):
+        return await call_next(request)
+    
+    commands = []
+    current_mongo_commands.set(commands)
+    _request_counts["started"] += 1
+    _request_counts["inflight"] += 1
+    
+    # Opt-in via admin header or random sampling; only one cProfile can run at a time
+    wants_profile = (
+        is_admin_token(request.headers.get("x-profile-request"))
+        or random.random() < PROFILE_SAMPLE_RATE
+    )
+    profiler = None
+    record_id = str(uuid.uuid4())
+    if wants_profile and not _profiler_active:
+        _profiler_active = True
+        overlapping = _request_counts["inflight"] - 1
+        started_before = _request_counts["started"]
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if wants_profile:
+            response.headers["X-Profile-Captured"] = "true" if profiler is not None else "false"
+            if profiler is not None:
+                response.headers["X-Profile-Id"] = record_id
+        return response
+    finally:
+        _request_counts["inflight"] -= 1
+        duration_ms = (time.perf_counter() - started) * 1000
+        profile_text = None
+        if profiler is not None:
+            profiler.disable()
+            _profiler_active = False
+            overlapping += _request_counts["started"] - started_before
+            out = io.StringIO()
+            out.write(
+                f"Process-wide profile window for {request.method} {request.url.path}; "
+                f"{overlapping} other request(s) overlapped and are included below.\n\n"
+            )
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            profile_text = out.getvalue()
+        
+        if duration_ms >= SLOW_REQUEST_MS or profile_text is not None:
+            record = {
+                "id": record_id,
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": status_code,
+                "duration_ms": round(duration_ms, 2),
+                "mongo_commands": commands,
+                "timestamp": datetime.utcnow().isoformat(),
+                "profile": profile_text,
+                "profile_scope": "process" if profile_text is not None else None,
+                "overlapping_requests": overlapping if profile_text is not None else None
+            }
+            slow_requests.append(record)
+            if duration_ms >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s took %.1fms with %d Mongo commands: %s",
+                    request.method, request.url.path, duration_ms, len(commands),
+                    ", ".join(f"{c['command']}({c['collection']}) {c['duration_ms']}ms" for c in commands)
+                )
+
+@api_router.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def list_slow_requests():
+    """List recent slow or profiled requests"""
+    return [
+        {**{k: v for k, v in record.items() if k != "profile"}, "has_profile": record["profile"] is not None}
+        for record in reversed(slow_requests)
+    ]
+
+@api_router.get("/admin/slow-requests/{record_id}/profile", dependencies=[Depends(require_admin)])
+async def download_request_profile(record_id: str):
+    """Download the cProfile report captured for a request"""
+    for record in slow_requests:
+        if record["id"] == record_id and record["profile"] is not None:
+            return PlainTextResponse(
+                record["profile"],
+                headers={"Content-Disposition": f'attachment; filename="profile-{record_id}.txt"'}
+            )
+    raise HTTPException(status_code=404, detail="Profile not found")
+
 # Health check
 @api_router.get("/health")
 async def health_check():
@@ -325,8 +1341,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Fails startup if the index cannot be built (e.g. duplicate keys already stored)
+    await ensure_idempotency_index()
+    app.state.analytics_task = asyncio.create_task(analytics_refresh_loop())
+    app.state.leaderboard_task = asyncio.create_task(leaderboard_reconcile_loop())
+    app.state.idempotency_task = asyncio.create_task(seed_idempotency_bloom())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.analytics_task.cancel()
+    app.state.leaderboard_task.cancel()
+    app.state.idempotency_task.cancel()
     client.close()
 
 if __name__ == "__main__":
@@ -9,6 +9,8 @@ import json
 import time
 from datetime import datetime
 import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # API Configuration
 BASE_URL = "https://latam-wallet.preview.emergentagent.com/api"
@@ -198,6 +200,54 @@ class APITester:
             self.log_test("Transaction Creation", False, f"Request error: {str(e)}")
             return None
     
+    def test_transaction_retry_storm(self):
+        """Load test: concurrent retries of one transfer must create one transaction and one reward"""
+        print("🔍 Testing Idempotent Transaction Retry Storm...")
+        try:
+            def slt_balance():
+                response = requests.get(f"{BASE_URL}/wallet/{TEST_WALLET_ADDRESS}", headers=HEADERS, timeout=10)
+                response.raise_for_status()
+                return response.json()["balance_slt"]
+            
+            transaction_data = {
+                "from_address": TEST_WALLET_ADDRESS,
+                "to_address": "9WzDXwBbmkg8ZTbNMqUxvQRAyrZzDsGYdLVL9zYtAWWM",
+                "amount": TEST_TRANSACTION_AMOUNT,
+                "token_type": "USDC"
+            }
+            retry_headers = {**HEADERS, "Idempotency-Key": str(uuid.uuid4())}
+            
+            def post_retry(_):
+                return requests.post(f"{BASE_URL}/transaction", 
+                                   json=transaction_data, 
+                                   headers=retry_headers, 
+                                   timeout=30)
+            
+            balance_before = slt_balance()
+            with ThreadPoolExecutor(max_workers=50) as pool:
+                responses = list(pool.map(post_retry, range(200)))
+            balance_after = slt_balance()
+            
+            if any(response.status_code != 200 for response in responses):
+                self.log_test("Transaction Retry Storm", False, "Non-200 responses during retry storm")
+                return False
+            
+            transaction_ids = {response.json()["id"] for response in responses}
+            reward_granted = round(balance_after - balance_before, 6)
+            expected_reward = round(TEST_TRANSACTION_AMOUNT * 0.1, 6)
+            if len(transaction_ids) == 1 and reward_granted == expected_reward:
+                self.log_test("Transaction Retry Storm", True, 
+                            f"200 retries -> 1 transaction, {reward_granted} SLT rewarded once")
+                return True
+            else:
+                self.log_test("Transaction Retry Storm", False, 
+                            f"{len(transaction_ids)} transactions, {reward_granted} SLT rewarded (expected {expected_reward})")
+                return False
+                
+        except Exception as e:
+            self.log_test("Transaction Retry Storm", False, f"Request error: {str(e)}")
+            return False
+    
     def test_transaction_history(self):
         """Test transaction history retrieval"""
         print("🔍 Testing Transaction History...")
@@ -331,6 +381,82 @@ class APITester:
             self.log_test("SLT Airdrop", False, f"Request error: {str(e)}")
             return False
     
+    def test_slt_leaderboard(self):
+        """Test SLT leaderboard and wallet rank after an airdrop"""
+        print("🔍 Testing SLT Leaderboard...")
+        try:
+            top = requests.get(f"{BASE_URL}/leaderboard/slt", 
+                             params={"limit": 5},
+                             headers=HEADERS, 
+                             timeout=10)
+            rank = requests.get(f"{BASE_URL}/leaderboard/slt/{TEST_WALLET_ADDRESS}", 
+                              headers=HEADERS, 
+                              timeout=10)
+            
+            if top.status_code == 200 and rank.status_code == 200:
+                entries = top.json().get("entries", [])
+                data = rank.json()
+                balances = [entry["balance_slt"] for entry in entries]
+                if (balances == sorted(balances, reverse=True) and 
+                    isinstance(data.get("rank"), int) and data["rank"] >= 1 and data.get("balance_slt", 0) > 0):
+                    self.log_test("SLT Leaderboard", True, 
+                                f"Test wallet ranked #{data['rank']} of {data.get('total_holders')} holders")
+                    return True
+                else:
+                    self.log_test("SLT Leaderboard", False, "Invalid leaderboard response", data)
+                    return False
+            else:
+                self.log_test("SLT Leaderboard", False, f"HTTP {top.status_code}/{rank.status_code}", rank.text)
+                return False
+                
+        except Exception as e:
+            self.log_test("SLT Leaderboard", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_token_analytics_admin_auth(self):
+        """Token-flow analytics must not be readable without the admin token"""
+        print("🔍 Testing Token-Flow Analytics Admin Protection...")
+        try:
+            response = requests.get(f"{BASE_URL}/analytics/tokens", 
+                                  params={"interval": "day"},
+                                  headers=HEADERS, 
+                                  timeout=10)
+            counterparties = requests.get(f"{BASE_URL}/analytics/counterparties", 
+                                        params={"token_type": "USDC", "limit": 5},
+                                        headers=HEADERS, 
+                                        timeout=10)
+            
+            if response.status_code == 403 and counterparties.status_code == 403:
+                self.log_test("Token Analytics Admin Auth", True, "Analytics endpoints reject missing token")
+                return True
+            else:
+                self.log_test("Token Analytics Admin Auth", False, 
+                            f"HTTP {response.status_code}/{counterparties.status_code}", response.text)
+                return False
+                
+        except Exception as e:
+            self.log_test("Token Analytics Admin Auth", False, f"Request error: {str(e)}")
+            return False
+    
+    def test_slow_request_admin_auth(self):
+        """Slow-request profiles must not be downloadable without the admin token"""
+        print("🔍 Testing Slow-Request Admin Endpoint Protection...")
+        try:
+            response = requests.get(f"{BASE_URL}/admin/slow-requests", 
+                                  headers=HEADERS, 
+                                  timeout=10)
+            
+            if response.status_code == 403:
+                self.log_test("Slow-Request Admin Auth", True, "Admin endpoint rejects missing token")
+                return True
+            else:
+                self.log_test("Slow-Request Admin Auth", False, f"HTTP {response.status_code}", response.text)
+                return False
+                
+        except Exception as e:
+            self.log_test("Slow-Request Admin Auth", False, f"Request error: {str(e)}")
+            return False
+    
     def test_cors_headers(self):
         """Test CORS configuration"""
         print("🔍 Testing CORS Headers...")
@@ -380,6 +506,7 @@ class APITester:
         transaction_id = self.test_transaction_creation()
         tests_passed.append(transaction_id is not None)
         tests_passed.append(self.test_transaction_history())
+        tests_passed.append(self.test_transaction_retry_storm())
         
         # 5. KYC System
         kyc_id = self.test_kyc_start()
@@ -388,6 +515,13 @@ class APITester:
         
         # 6. SLT Token System
         tests_passed.append(self.test_slt_airdrop())
+        tests_passed.append(self.test_slt_leaderboard())
+        
+        # 7. Analytics
+        tests_passed.append(self.test_token_analytics_admin_auth())
+        
+        # 8. Admin
+        tests_passed.append(self.test_slow_request_admin_auth())
         
         # Print summary
         print("=" * 60)
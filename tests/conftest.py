@@ -0,0 +1,14 @@
+"""
+Shared setup for the in-process backend tests.
+
+server.py reads MONGO_URL and DB_NAME at import time and creates a lazy motor client;
+none of these tests talk to Mongo, so placeholders are enough.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "sueltalo_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,111 @@
+"""
+In-process tests for the analytics refresh lease and cache invalidation across workers
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, option) for option in condition):
+                return False
+        elif isinstance(condition, dict) and "$lte" in condition:
+            if field not in doc or doc[field] > condition["$lte"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeMeta:
+    """analytics_meta with Mongo's upsert semantics: a filter miss inserts, and _id is unique"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is not None and matches(doc, query):
+            doc.update(update["$set"])
+        elif doc is not None and upsert:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        elif upsert:
+            self.docs[query["_id"]] = {"_id": query["_id"], **update["$set"]}
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["_id"], {"_id": query["_id"]}).update(update["$set"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.analytics_meta = FakeMeta()
+
+
+def test_only_the_lease_holder_refreshes_until_the_lease_expires(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(server, "db", fake)
+
+    def acquire_as(worker):
+        monkeypatch.setattr(server, "ANALYTICS_WORKER_ID", worker)
+        return asyncio.run(server.acquire_analytics_lease())
+
+    assert acquire_as("worker-a")
+    assert not acquire_as("worker-b")
+    assert acquire_as("worker-a")
+
+    fake.analytics_meta.docs["refresh_lease"]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    assert acquire_as("worker-b")
+    assert not acquire_as("worker-a")
+    assert fake.analytics_meta.docs["refresh_lease"]["owner"] == "worker-b"
+
+
+def test_followers_clear_their_cache_when_the_holder_refreshes(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(server, "db", fake)
+    monkeypatch.setattr(server, "analytics_cache", {("tokens",): "stale"})
+    monkeypatch.setitem(server.analytics_state, "refreshed_at", None)
+
+    asyncio.run(server.sync_analytics_state())
+    assert server.analytics_cache == {("tokens",): "stale"}
+
+    fake.analytics_meta.docs["refresh_state"] = {"_id": "refresh_state", "refreshed_at": datetime.utcnow()}
+    asyncio.run(server.sync_analytics_state())
+    assert server.analytics_cache == {}
+    assert server.analytics_state["refreshed_at"] == fake.analytics_meta.docs["refresh_state"]["refreshed_at"]
+
+
+def test_results_computed_across_a_refresh_are_not_cached(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(server, "db", fake)
+    monkeypatch.setattr(server, "analytics_cache", {})
+    monkeypatch.setitem(server.analytics_state, "refreshed_at", None)
+    monkeypatch.setitem(server.analytics_state, "generation", 0)
+
+    async def run():
+        async def compute_during_refresh():
+            fake.analytics_meta.docs["refresh_state"] = {"_id": "refresh_state", "refreshed_at": datetime.utcnow()}
+            await server.sync_analytics_state()
+            return "computed from pre-refresh buckets"
+
+        async def compute_after_refresh():
+            return "fresh"
+
+        first = await server._cached_analytics(("tokens",), compute_during_refresh)
+        second = await server._cached_analytics(("tokens",), compute_after_refresh)
+        third = await server._cached_analytics(("tokens",), compute_during_refresh)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == "computed from pre-refresh buckets"
+    assert second == third == "fresh"
+    assert server.analytics_cache == {("tokens",): (1, "fresh")}
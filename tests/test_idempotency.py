@@ -0,0 +1,168 @@
+"""
+In-process tests for idempotent transaction ingest against fake collections that enforce
+the unique idempotency_key index and the wallet reward ledger
+"""
+
+import asyncio
+import itertools
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+import server
+from server import BloomFilter, IdempotencyGuard, SLTLeaderboard, TransactionCreate
+
+SENDER = "sender-wallet"
+
+
+class FakeTransactions:
+    def __init__(self):
+        self.docs = []
+        self.ids = itertools.count(1)
+        self.inserts = 0
+        self.fail_next_update = False
+
+    async def insert_one(self, document):
+        await asyncio.sleep(0)
+        key = document.get("idempotency_key")
+        if key is not None and any(doc.get("idempotency_key") == key for doc in self.docs):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        document["_id"] = next(self.ids)
+        self.docs.append(dict(document))
+        self.inserts += 1
+        return type("InsertOneResult", (), {"inserted_id": document["_id"]})()
+
+    async def find_one(self, query):
+        await asyncio.sleep(0)
+        return next((dict(doc) for doc in self.docs if doc.get("idempotency_key") == query["idempotency_key"]), None)
+
+    async def update_one(self, query, update):
+        await asyncio.sleep(0)
+        if self.fail_next_update:
+            self.fail_next_update = False
+            raise ConnectionError("connection reset")
+        for doc in self.docs:
+            if doc["_id"] == query["_id"]:
+                doc.update(update["$set"])
+
+
+class FakeWallets:
+    def __init__(self):
+        self.wallet = {"public_key": SENDER, "balance_slt": 0.0, "slt_version": 0, "rewarded_transactions": []}
+        self.incs = 0
+        self.fail_next_inc = False
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        await asyncio.sleep(0)
+        if self.fail_next_inc:
+            self.fail_next_inc = False
+            raise ConnectionError("connection reset")
+        ledger = self.wallet["rewarded_transactions"]
+        if query["public_key"] != SENDER or query["rewarded_transactions"]["$ne"] in ledger:
+            return None
+        for field, amount in update["$inc"].items():
+            self.wallet[field] += amount
+        push = update["$push"]["rewarded_transactions"]
+        self.wallet["rewarded_transactions"] = (ledger + push["$each"])[push["$slice"]:]
+        self.incs += 1
+        return {"balance_slt": self.wallet["balance_slt"], "slt_version": self.wallet["slt_version"]}
+
+
+class FakeDB:
+    def __init__(self):
+        self.transactions = FakeTransactions()
+        self.wallets = FakeWallets()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(server, "db", fake)
+    monkeypatch.setattr(server, "idempotency_guard", IdempotencyGuard(1000, 100))
+    monkeypatch.setattr(server, "slt_leaderboard", SLTLeaderboard())
+    return fake
+
+
+def usdc_transfer(amount=10.0):
+    return TransactionCreate(from_address=SENDER, to_address="receiver-wallet", amount=amount, token_type="USDC")
+
+
+def post(transaction, key):
+    return server.create_transaction(transaction, idempotency_key=key)
+
+
+def test_concurrent_retries_insert_and_reward_once(fake_db):
+    async def run():
+        return await asyncio.gather(*[post(usdc_transfer(), "retry-storm") for _ in range(200)])
+
+    results = asyncio.run(run())
+
+    assert len({result.id for result in results}) == 1
+    assert fake_db.transactions.inserts == 1
+    assert fake_db.wallets.incs == 1
+    assert fake_db.wallets.wallet["balance_slt"] == pytest.approx(1.0)
+    assert fake_db.transactions.docs[0]["reward_granted"] is True
+    assert server.idempotency_guard.stats["duplicates_rejected"] == 199
+
+
+def test_another_worker_takes_the_duplicate_key_path(fake_db, monkeypatch):
+    first = asyncio.run(post(usdc_transfer(), "cross-worker"))
+    # A second process: empty LRU and Bloom filter, so only the unique index stops it
+    monkeypatch.setattr(server, "idempotency_guard", IdempotencyGuard(1000, 100))
+    second = asyncio.run(post(usdc_transfer(), "cross-worker"))
+
+    assert second.id == first.id
+    assert fake_db.transactions.inserts == 1
+    assert fake_db.wallets.incs == 1
+    assert server.idempotency_guard.stats["bloom_negatives"] == 1
+
+
+def test_key_reused_for_a_different_transfer_is_rejected(fake_db):
+    asyncio.run(post(usdc_transfer(10.0), "reused"))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(post(usdc_transfer(99.0), "reused"))
+
+    assert error.value.status_code == 409
+    assert fake_db.wallets.incs == 1
+
+
+def test_retry_finishes_a_reward_that_failed_after_the_insert(fake_db):
+    fake_db.wallets.fail_next_inc = True
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(post(usdc_transfer(), "interrupted"))
+    assert error.value.status_code == 500
+    assert fake_db.transactions.docs[0]["reward_granted"] is False
+    assert fake_db.wallets.incs == 0
+
+    retried = asyncio.run(post(usdc_transfer(), "interrupted"))
+    again = asyncio.run(post(usdc_transfer(), "interrupted"))
+
+    assert retried.id == again.id == fake_db.transactions.docs[0]["id"]
+    assert fake_db.transactions.inserts == 1
+    assert fake_db.wallets.incs == 1
+    assert fake_db.transactions.docs[0]["reward_granted"] is True
+
+
+def test_retry_after_the_credit_but_before_the_flag_does_not_pay_twice(fake_db):
+    fake_db.transactions.fail_next_update = True
+    with pytest.raises(HTTPException):
+        asyncio.run(post(usdc_transfer(), "flag-lost"))
+    assert fake_db.wallets.incs == 1
+
+    asyncio.run(post(usdc_transfer(), "flag-lost"))
+
+    assert fake_db.wallets.incs == 1
+    assert fake_db.wallets.wallet["balance_slt"] == pytest.approx(1.0)
+    assert fake_db.transactions.docs[0]["reward_granted"] is True
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(20000)
+    keys = [f"key-{i}" for i in range(20000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+    assert false_positives < 20000 * 0.03
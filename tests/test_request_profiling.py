@@ -0,0 +1,83 @@
+"""
+In-process tests for the slow-request recorder and profile downloads; no Mongo needed because
+the TestClient is never entered, so startup tasks do not run
+"""
+
+import asyncio
+import contextvars
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+TOKEN = "test-admin-token"
+
+
+def fake_find(request_id):
+    """Drive the command listener from an executor thread, the way motor does"""
+    recorder = server.MongoCommandRecorder()
+    recorder.started(SimpleNamespace(
+        command_name="find", command={"find": "wallets"}, request_id=request_id
+    ))
+    recorder.succeeded(SimpleNamespace(request_id=request_id, duration_micros=1500))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, "SLOW_REQUEST_MS", 0)
+    monkeypatch.setattr(server, "ADMIN_TOKEN", TOKEN)
+    monkeypatch.setattr(server, "slow_requests", deque(maxlen=3))
+
+    @server.app.get("/test/mongo-read")
+    async def mongo_read():
+        context = contextvars.copy_context()
+        await asyncio.get_running_loop().run_in_executor(None, context.run, fake_find, 1)
+        return {"ok": True}
+
+    yield TestClient(server.app)
+    server.app.router.routes.pop()
+
+
+def test_slow_requests_are_recorded_with_their_mongo_commands(client):
+    assert client.get("/test/mongo-read").status_code == 200
+
+    [record] = server.slow_requests
+    assert record["path"] == "/test/mongo-read"
+    assert record["mongo_commands"] == [
+        {"command": "find", "collection": "wallets", "duration_ms": 1.5, "success": True}
+    ]
+
+
+def test_buffer_is_bounded_and_admin_polling_is_not_recorded(client):
+    for _ in range(5):
+        client.get("/api/health")
+    listed = client.get("/api/admin/slow-requests", headers={"X-Admin-Token": TOKEN})
+
+    assert listed.status_code == 200
+    assert len(server.slow_requests) == 3
+    assert all(record["path"] == "/api/health" for record in server.slow_requests)
+
+
+def test_profile_downloads_with_the_admin_token_only(client):
+    response = client.get("/api/health", headers={"X-Profile-Request": TOKEN})
+    assert response.headers["X-Profile-Captured"] == "true"
+    record_id = response.headers["X-Profile-Id"]
+    url = f"/api/admin/slow-requests/{record_id}/profile"
+
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    download = client.get(url, headers={"X-Admin-Token": TOKEN})
+    assert download.status_code == 200
+    assert download.text.startswith("Process-wide profile window for GET /api/health")
+
+
+def test_skipped_profile_is_reported(client, monkeypatch):
+    monkeypatch.setattr(server, "_profiler_active", True)
+    response = client.get("/api/health", headers={"X-Profile-Request": TOKEN})
+
+    assert response.headers["X-Profile-Captured"] == "false"
+    assert "X-Profile-Id" not in response.headers
+    assert "X-Profile-Captured" not in client.get("/api/health").headers
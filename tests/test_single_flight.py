@@ -0,0 +1,99 @@
+"""
+In-process tests for request coalescing: Mongo reads stay flat as concurrent readers grow
+"""
+
+import asyncio
+
+import pytest
+
+from server import SingleFlight
+
+
+class SlowLoader:
+    """Fake Mongo read that counts how often it actually runs"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"balance": self.calls}
+
+
+@pytest.mark.parametrize("readers", [1, 10, 100, 1000])
+def test_concurrent_identical_reads_share_one_query(readers):
+    async def run():
+        flight = SingleFlight()
+        loader = SlowLoader()
+        results = await asyncio.gather(*[
+            flight.do(("balance", "wallet", ()), loader) for _ in range(readers)
+        ])
+        return flight, loader, results
+
+    flight, loader, results = asyncio.run(run())
+
+    assert loader.calls == 1
+    assert flight.stats["executed"] == 1
+    assert flight.stats["coalesced"] == readers - 1
+    assert all(result == {"balance": 1} for result in results)
+    assert flight.snapshot()["inflight"] == 0
+
+
+def test_different_keys_are_not_coalesced():
+    async def run():
+        flight = SingleFlight()
+        loader = SlowLoader()
+        await asyncio.gather(
+            flight.do(("balance", "wallet-a", ()), loader),
+            flight.do(("balance", "wallet-b", ()), loader),
+            flight.do(("transactions", "wallet-a", (("limit", 50),)), loader),
+        )
+        return flight, loader
+
+    flight, loader = asyncio.run(run())
+
+    assert loader.calls == 3
+    assert flight.stats["coalesced"] == 0
+
+
+def test_invalidate_makes_next_caller_re_execute():
+    async def run():
+        flight = SingleFlight()
+        loader = SlowLoader()
+        key = ("balance", "wallet", ())
+        before_write = [asyncio.ensure_future(flight.do(key, loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+
+        flight.invalidate("wallet")
+        after_write = await flight.do(key, loader)
+        return flight, loader, await asyncio.gather(*before_write), after_write
+
+    flight, loader, before_write, after_write = asyncio.run(run())
+
+    assert loader.calls == 2
+    assert flight.stats["executed"] == 2
+    assert flight.stats["coalesced"] == 4
+    assert flight.stats["invalidated"] == 1
+    assert all(result == before_write[0] for result in before_write)
+    assert after_write is not before_write[0]
+
+
+def test_errors_propagate_to_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("mongo down")
+
+        return flight, await asyncio.gather(*[
+            flight.do(("balance", "wallet", ()), failing) for _ in range(10)
+        ], return_exceptions=True)
+
+    flight, results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats["executed"] == 1
+    assert flight.snapshot()["inflight"] == 0
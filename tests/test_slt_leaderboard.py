@@ -0,0 +1,227 @@
+"""
+In-process tests for the SLT leaderboard skip list and its Mongo reconciliation
+"""
+
+import asyncio
+import random
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import SLTLeaderboard
+
+
+def expected_order(balances):
+    return sorted((-balance, public_key) for public_key, balance in balances.items() if balance > 0)
+
+
+def assert_matches(board, balances):
+    order = expected_order(balances)
+    assert len(board) == len(order)
+    assert [(-entry["balance_slt"], entry["public_key"]) for entry in board.top(len(order) + 5)] == order
+    for rank, (_, public_key) in enumerate(order, 1):
+        assert board.rank(public_key) == rank
+
+
+def test_random_updates_match_sorted_reference():
+    rng = random.Random(7)
+    board, balances = SLTLeaderboard(), {}
+    for step in range(5000):
+        public_key = f"w{rng.randrange(500)}"
+        balances[public_key] = rng.choice([0, rng.randint(1, 20), rng.random() * 100])
+        board.update(public_key, balances[public_key])
+        if step % 500 == 0:
+            assert_matches(board, balances)
+    assert_matches(board, balances)
+
+
+def test_bulk_load_then_updates_match_sorted_reference():
+    rng = random.Random(11)
+    balances = {f"w{i}": rng.choice([rng.randint(1, 50), rng.random() * 100]) for i in range(3000)}
+    board = SLTLeaderboard()
+    for _, public_key in expected_order(balances):
+        assert board.append_sorted(public_key, balances[public_key])
+    board.finish_bulk()
+    assert_matches(board, balances)
+
+    for _ in range(2000):
+        public_key = f"w{rng.randrange(3500)}"
+        balances[public_key] = rng.choice([0, rng.random() * 100])
+        board.update(public_key, balances[public_key])
+    assert_matches(board, balances)
+
+
+def test_bulk_load_rejects_out_of_order_wallets():
+    board = SLTLeaderboard()
+    assert board.append_sorted("a", 10.0)
+    assert not board.append_sorted("b", 20.0)
+    assert not board.append_sorted("a", 5.0)
+    assert not board.append_sorted("c", 0.0)
+    board.finish_bulk()
+    board.update("b", 20.0)
+    assert board.rank("b") == 1 and board.rank("a") == 2
+
+
+class FakeCursor:
+    """Mimics motor: documents from an already fetched batch are yielded without awaiting"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeWallets:
+    def __init__(self, balances):
+        self.balances = balances
+
+    def find(self, query, projection=None):
+        if "public_key" in query:
+            wanted = set(query["public_key"]["$in"])
+            docs = [{"public_key": k, "balance_slt": v} for k, v in self.balances.items() if k in wanted]
+        else:
+            docs = [{"public_key": k, "balance_slt": v} for k, v in self.balances.items() if v > 0]
+        return FakeCursor(docs)
+
+
+class FakeDB:
+    def __init__(self, balances):
+        self.wallets = FakeWallets(balances)
+
+
+def run_with_max_stall(coroutine):
+    """Run coroutine while a ticker measures the longest gap the event loop went without yielding"""
+    async def run():
+        stalls = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0)
+                now = time.perf_counter()
+                stalls.append(now - last)
+                last = now
+
+        tick = asyncio.ensure_future(ticker())
+        await coroutine
+        done.set()
+        await tick
+        return max(stalls)
+
+    return asyncio.run(run())
+
+
+def test_reconcile_seeds_then_patches_without_stalling(monkeypatch):
+    balances = {f"w{i}": float(i + 1) for i in range(60000)}
+    monkeypatch.setattr(server, "db", FakeDB(balances))
+    monkeypatch.setattr(server, "LEADERBOARD_YIELD_EVERY", 1000)
+    monkeypatch.setattr(server, "slt_leaderboard", SLTLeaderboard())
+    monkeypatch.setitem(server.leaderboard_state, "reconciled_at", None)
+
+    max_stall = run_with_max_stall(server.reconcile_slt_leaderboard())
+    assert len(server.slt_leaderboard) == len(balances)
+    assert server.slt_leaderboard.rank("w59999") == 1
+    assert max_stall < 0.25
+
+    # Patch pass: changed, new and emptied wallets are applied to the same board object
+    board = server.slt_leaderboard
+    balances.update({"w0": 100000.0, "new": 90000.0, "w59999": 0.0})
+    max_stall = run_with_max_stall(server.reconcile_slt_leaderboard())
+    assert server.slt_leaderboard is board
+    assert board.rank("w0") == 1 and board.rank("new") == 2 and board.rank("w59999") is None
+    assert len(board) == len(balances) - 1
+    assert max_stall < 0.25
+
+
+def test_out_of_order_writebacks_keep_the_newest_balance():
+    board = SLTLeaderboard()
+    board.update("a", 10.0, version=1)
+    # Two concurrent $incs: version 3 (balance 30) is written back before version 2 (balance 20)
+    board.update("a", 30.0, version=3)
+    board.update("a", 20.0, version=2)
+    assert board.balance("a") == 30.0
+
+    board.update("b", 25.0, version=1)
+    assert board.rank("a") == 1 and board.rank("b") == 2
+
+
+def test_endpoints_return_503_until_the_first_seed(monkeypatch):
+    monkeypatch.setattr(server, "slt_leaderboard", SLTLeaderboard())
+    monkeypatch.setitem(server.leaderboard_state, "reconciled_at", None)
+    # Written since startup, but the rest of the wallets are not on the board yet
+    server.slt_leaderboard.update("a", 5.0)
+
+    for endpoint in (server.get_slt_leaderboard(), server.get_slt_rank("a")):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(endpoint)
+        assert error.value.status_code == 503
+
+    monkeypatch.setattr(server, "db", FakeDB({"a": 5.0, "b": 9.0}))
+    asyncio.run(server.reconcile_slt_leaderboard())
+    rank = asyncio.run(server.get_slt_rank("a"))
+    assert rank["rank"] == 2
+    assert rank["reconciled_at"] == server.leaderboard_state["reconciled_at"].isoformat()
+
+
+class FlakyWallets(FakeWallets):
+    """Fails the first seed, as an unreachable Mongo would"""
+
+    def __init__(self, balances):
+        super().__init__(balances)
+        self.seed_attempts = 0
+
+    async def create_index(self, keys):
+        self.seed_attempts += 1
+        if self.seed_attempts == 1:
+            raise ConnectionError("mongo unavailable")
+
+
+def test_failed_first_seed_is_retried_with_a_short_backoff(monkeypatch):
+    fake = FakeDB({"a": 5.0})
+    fake.wallets = FlakyWallets({"a": 5.0})
+    monkeypatch.setattr(server, "db", fake)
+    monkeypatch.setattr(server, "slt_leaderboard", SLTLeaderboard())
+    monkeypatch.setitem(server.leaderboard_state, "reconciled_at", None)
+    monkeypatch.setattr(server, "LEADERBOARD_SEED_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(server, "LEADERBOARD_RECONCILE_SECONDS", 3600)
+
+    async def run():
+        loop_task = asyncio.ensure_future(server.leaderboard_reconcile_loop())
+        try:
+            for _ in range(100):
+                if server.leaderboard_state["reconciled_at"] is not None:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            loop_task.cancel()
+
+    asyncio.run(run())
+    assert fake.wallets.seed_attempts == 2
+    assert server.slt_leaderboard.rank("a") == 1
+
+
+def test_reconciled_removals_forget_the_wallet_version():
+    board = SLTLeaderboard()
+    board.update("a", 10.0, version=4)
+    board.update("b", 5.0, version=2)
+    board.update("b", 0.0, version=3)
+    board.update("a", 0.0)
+
+    assert len(board) == 0
+    assert "a" not in board._versions
+    # A versioned zero keeps its version so older writebacks still lose
+    board.update("b", 5.0, version=2)
+    assert board.rank("b") is None